@@ -1,11 +1,18 @@
 import re
 import os
 from decimal import Decimal
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from itertools import chain, groupby
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, get_flashed_messages, stream_template
+from jinja2 import FileSystemBytecodeCache
+from jinja2.environment import TemplateStream
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 from dotenv import load_dotenv
 from models import db, User, Product, Cart, Purchase
+from compression import init_compression
+from ratelimit import limiter
 from sqlalchemy import or_
 from datetime import datetime
 from decimal import InvalidOperation
@@ -15,6 +22,8 @@ load_dotenv()
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 UPLOAD_FOLDER = 'static'  # Save images to static/
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+STREAM_BUFFER_SIZE = 20  # template fragments per streamed chunk
+STREAM_YIELD_PER = 100  # rows fetched per round trip from the server-side cursor
 
 
 
@@ -24,7 +33,20 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'devsecret')
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['RATELIMIT_STORAGE_URL'] = os.getenv('RATELIMIT_STORAGE_URL')  # e.g. redis://localhost:6379/0
+    # Number of reverse proxies in front of the app. When set, request.remote_addr
+    # (used for per-IP rate limits) is the client address from X-Forwarded-For.
+    trusted_proxies = int(os.getenv('TRUSTED_PROXIES', 0))
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
     db.init_app(app)
+    init_compression(app)
+    limiter.init_app(app)
+
+    # Cache compiled templates on disk and compile them all up front
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.getenv('TEMPLATE_CACHE_DIR'))
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
 
     with app.app_context():
         db.create_all()
@@ -34,6 +56,7 @@ def create_app():
 app = create_app()
 
 CATEGORIES = ['Clothing', 'Electronics', 'Books', 'Furniture', 'Accessories', 'Other']
+ORDER_STATUSES = ['Pending', 'Shipped', 'Delivered', 'Cancelled']
 
 EMAIL_REGEX = re.compile(r"[^@]+@[^@]+\.[^@]+")
 
@@ -50,7 +73,20 @@ def login_required(f):
         return f(*args, **kwargs)
     return wrapped
 
+def stream_page(template_name, **context):
+    # Pop flashes now: the session cookie is sent before the body is rendered
+    get_flashed_messages()
+    fragments = stream_template(template_name, **context)
+    # stream_template yields one small fragment at a time; TemplateStream
+    # batches them so each chunk is worth compressing and sending
+    stream = TemplateStream(fragments)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    # TemplateStream has no close(), so close the generator ourselves: that
+    # pops the request context and runs teardown when a client disconnects
+    return Response(ClosingIterator(stream, fragments.close), mimetype='text/html')
+
 @app.route('/')
+@limiter.limit(per_ip='60/minute', per_route='1200/minute', concurrency=8)
 def feed():
     category = request.args.get('category')
     search = request.args.get('search')
@@ -59,10 +95,11 @@ def feed():
         query = query.filter(Product.category == category)
     if search:
         query = query.filter(Product.title.ilike(f'%{search}%'))
-    products = query.order_by(Product.created_at.desc()).all()
-    return render_template('feed.html', products=products, categories=CATEGORIES, selected_category=category, search=search)
+    products = query.order_by(Product.created_at.desc()).yield_per(STREAM_YIELD_PER)
+    return stream_page('feed.html', products=products, categories=CATEGORIES, selected_category=category, search=search)
 
 @app.route('/register', methods=['GET','POST'])
+@limiter.limit(per_ip='5/minute', methods=['POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username','').strip()
@@ -83,6 +120,7 @@ def register():
     return render_template('register.html')
 
 @app.route('/login', methods=['GET','POST'])
+@limiter.limit(per_ip='10/minute', methods=['POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email','').strip().lower()
@@ -102,6 +140,7 @@ def logout():
     return redirect(url_for('feed'))
 
 @app.route('/product/add', methods=['GET','POST'])
+@limiter.limit(per_user='10/minute', methods=['POST'])
 @login_required
 def add_product():
     if request.method == 'POST':
@@ -151,17 +190,25 @@ def product_detail(pid):
     return render_template('product_detail.html', product=p)
 
 @app.route('/my-listings')
+@limiter.limit(concurrency=4)
 @login_required
 def my_listings():
-    products = Product.query.filter_by(user_id=session['user_id']).order_by(Product.created_at.desc()).all()
-    products_with_orders = []
-    for p in products:
-        orders = Purchase.query.filter_by(product_id=p.id).order_by(Purchase.purchased_at.desc()).all()
-        products_with_orders.append({
-            'product': p,
-            'orders': orders
-        })
-    return render_template('my_listings.html', products_with_orders=products_with_orders)
+    # One joined query over a server-side cursor. No other query may run while
+    # it is open, so the template must not touch relationships: buyer names
+    # come from the same rows as their orders.
+    rows = db.session.query(Product, Purchase, User.username) \
+        .outerjoin(Purchase, Purchase.product_id == Product.id) \
+        .outerjoin(User, User.id == Purchase.user_id) \
+        .filter(Product.user_id == session['user_id']) \
+        .order_by(Product.created_at.desc(), Product.id, Purchase.purchased_at.desc()) \
+        .yield_per(STREAM_YIELD_PER)
+    products_with_orders = (
+        {'product': p, 'orders': [(order, buyer) for _, order, buyer in group if order is not None]}
+        for p, group in groupby(rows, key=lambda row: row[0])
+    )
+    first = next(products_with_orders, None)
+    products_with_orders = chain([first], products_with_orders) if first is not None else None
+    return stream_page('my_listings.html', products_with_orders=products_with_orders)
 
 
 @app.route('/product/<int:pid>/edit', methods=['GET','POST'])
@@ -222,6 +269,7 @@ def delete_product(pid):
     return redirect(url_for('my_listings'))
 
 @app.route('/cart/add/<int:pid>', methods=['POST'])
+@limiter.limit(per_ip='60/minute', per_user='30/minute')
 @login_required
 def add_to_cart(pid):
     existing = Cart.query.filter_by(user_id=session['user_id'], product_id=pid).first()
@@ -243,6 +291,7 @@ def view_cart():
 
 # In your app.py, the checkout route should look like this:
 @app.route('/checkout', methods=['GET', 'POST'])
+@limiter.limit(per_user='10/minute', methods=['POST'])
 @login_required
 def checkout():
     items = Cart.query.filter_by(user_id=session['user_id']).all()
@@ -285,6 +334,26 @@ def purchases():
     records = Purchase.query.filter_by(user_id=session['user_id']).order_by(Purchase.purchased_at.desc()).all()
     return render_template('purchases.html', records=records)
 
+@app.route('/my-orders')
+@login_required
+def my_orders():
+    orders = Purchase.query.filter_by(user_id=session['user_id']).order_by(Purchase.purchased_at.desc()).all()
+    return render_template('my_orders.html', purchases=orders)
+
+@app.route('/order/<int:purchase_id>/status', methods=['POST'])
+@login_required
+def update_order_status(purchase_id):
+    order = Purchase.query.get_or_404(purchase_id)
+    if order.product.user_id != session['user_id']:
+        flash('Not allowed.', 'danger'); return redirect(url_for('my_listings'))
+    status = request.form.get('status')
+    if status not in ORDER_STATUSES:
+        flash('Invalid order status.', 'danger'); return redirect(url_for('my_listings'))
+    order.status = status
+    db.session.commit()
+    flash('Order status updated.', 'success')
+    return redirect(url_for('my_listings'))
+
 @app.route('/dashboard', methods=['GET','POST'])
 @login_required
 def dashboard():
@@ -0,0 +1,79 @@
+# backend/compression.py
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+
+def _gzip_chunks(chunks, level):
+    # Flush after every chunk so streamed pages still reach the client early
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_chunks(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _compress(chunks, encoding, app):
+    if encoding == 'br':
+        return _brotli_chunks(chunks, app.config['COMPRESS_BR_QUALITY'])
+    return _gzip_chunks(chunks, app.config['COMPRESS_LEVEL'])
+
+
+def _pick_encoding():
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)  # bytes
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_QUALITY', 5)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = _pick_encoding()
+        if not encoding:
+            return response
+
+        if response.is_streamed:
+            # Size is unknown up front, so streamed pages are always compressed
+            original = response.response
+            if hasattr(original, 'close'):
+                response.call_on_close(original.close)
+            response.response = _compress(response.iter_encoded(), encoding, app)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(b''.join(_compress([data], encoding, app)))
+
+        response.headers['Content-Encoding'] = encoding
+        return response
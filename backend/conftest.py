@@ -0,0 +1,37 @@
+# backend/conftest.py
+import os
+import tempfile
+
+import pytest
+
+# app.py builds the app at import time, so point it at SQLite before any test imports it
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+os.environ.pop('RATELIMIT_STORAGE_URL', None)
+
+from app import app as flask_app
+from models import db
+from ratelimit import MemoryStorage, RateLimiter, limiter
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    limiter.storage = MemoryStorage()
+    limiter.gates = {}
+    limiter.stats = RateLimiter().stats
+    limiter._storage_down = False
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
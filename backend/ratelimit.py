@@ -0,0 +1,319 @@
+# backend/ratelimit.py
+import math
+import threading
+from time import monotonic, time
+from flask import Response, abort, g, jsonify, request, session
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(spec):
+    """'10/minute' -> (tokens per second, bucket size)"""
+    count, _, period = spec.partition('/')
+    count = int(count)
+    return count / PERIODS[period.strip()], count
+
+
+class MemoryStorage:
+    """Token buckets kept in this worker process.
+
+    consume() takes every bucket a request draws from and charges them only
+    if all of them have a token, returning (allowed, seconds until retry).
+    """
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def consume(self, buckets):
+        now = monotonic()
+        with self._lock:
+            levels = []
+            retry_after = 0
+            for key, rate, burst in buckets:
+                tokens, last, _ = self._buckets.get(key, (burst, now, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    retry_after = max(retry_after, (1 - tokens) / rate)
+            if retry_after:
+                return False, retry_after
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                tokens -= 1
+                # A bucket that has refilled is the same as a missing one
+                self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        return True, 0
+
+
+class RedisStorage:
+    """Token buckets shared by every worker through a Redis-compatible server."""
+
+    # Same all-or-nothing check as MemoryStorage, in one round trip.
+    # ARGV is now, then a rate/burst pair per key.
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local levels = {}
+    local retry_after = 0
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i])
+        local burst = tonumber(ARGV[2 * i + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+        levels[i] = tokens
+        if tokens < 1 then
+            retry_after = math.max(retry_after, (1 - tokens) / rate)
+        end
+    end
+    if retry_after > 0 then
+        return {0, tostring(retry_after)}
+    end
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i])
+        local burst = tonumber(ARGV[2 * i + 1])
+        redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return {1, '0'}
+    """
+
+    def __init__(self, url, timeout):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL is set but the redis package is not installed.')
+        client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._consume = client.register_script(self.SCRIPT)
+
+    def consume(self, buckets):
+        keys = ['ratelimit:' + key for key, _, _ in buckets]
+        args = [time()]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        allowed, retry_after = self._consume(keys=keys, args=args)
+        return bool(allowed), float(retry_after)
+
+
+class ConcurrencyGate:
+    """Caps in-flight requests for one endpoint, queueing the overflow.
+
+    Requests are shed instead of queued when the queue is full or when the
+    expected wait (from a moving average of request latency) would exceed
+    the latency budget.
+    """
+
+    def __init__(self, limit, max_queue, budget):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.budget = budget
+        self.active = 0
+        self.waiting = 0
+        self.avg_latency = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            expected_wait = (self.waiting + 1) * self.avg_latency / self.limit
+            if self.waiting >= self.max_queue or expected_wait > self.budget:
+                return False
+            deadline = monotonic() + self.budget
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed=None):
+        """Free a slot; elapsed is left out for requests that never ran."""
+        with self._cond:
+            self.active -= 1
+            if elapsed is not None:
+                self.avg_latency = elapsed if not self.avg_latency else 0.8 * self.avg_latency + 0.2 * elapsed
+            self._cond.notify()
+
+
+class RateLimiter:
+    def __init__(self):
+        self.storage = None
+        self.gates = {}
+        self.stats = {'checks': 0, 'overhead_total': 0.0, 'overhead_max': 0.0,
+                      'limited': 0, 'shed': 0, 'queue_wait_total': 0.0}
+        self._stats_lock = threading.Lock()
+        self._gates_lock = threading.Lock()
+        self._storage_lock = threading.Lock()
+        self._storage_down = False
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_DEFAULT', '300/minute')  # per IP, every route
+        app.config.setdefault('RATELIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATELIMIT_STORAGE_TIMEOUT', 0.05)  # seconds
+        app.config.setdefault('RATELIMIT_METRICS_ENABLED', True)
+        app.config.setdefault('RATELIMIT_METRICS_ALLOW', ('127.0.0.1', '::1'))
+        app.config.setdefault('RATELIMIT_MAX_QUEUE', 16)
+        app.config.setdefault('RATELIMIT_LATENCY_BUDGET', 2.0)  # seconds
+        self.app = app
+        url = app.config['RATELIMIT_STORAGE_URL']
+        self.storage = RedisStorage(url, app.config['RATELIMIT_STORAGE_TIMEOUT']) if url else MemoryStorage()
+        self.default = parse_rate(app.config['RATELIMIT_DEFAULT'])
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics/limiter', 'limiter_metrics', self.metrics)
+
+    def limit(self, per_ip=None, per_user=None, per_route=None, concurrency=None, methods=None):
+        """Attach extra limits to a view; place it below @app.route."""
+        def decorator(f):
+            f._rate_limits = {
+                'per_ip': per_ip and parse_rate(per_ip),
+                'per_user': per_user and parse_rate(per_user),
+                'per_route': per_route and parse_rate(per_route),
+                'concurrency': concurrency,
+                'methods': methods,
+            }
+            return f
+        return decorator
+
+    def _buckets(self, endpoint, limits):
+        ip = request.remote_addr or 'unknown'
+        yield 'ip:' + ip, *self.default
+        if not limits or (limits['methods'] and request.method not in limits['methods']):
+            return
+        if limits['per_ip']:
+            yield f'ip:{ip}:{endpoint}', *limits['per_ip']
+        if limits['per_user'] and 'user_id' in session:
+            yield f"user:{session['user_id']}:{endpoint}", *limits['per_user']
+        if limits['per_route']:
+            yield 'route:' + endpoint, *limits['per_route']
+
+    def _gate(self, endpoint, limits):
+        if not limits or not limits['concurrency']:
+            return None
+        gate = self.gates.get(endpoint)
+        if gate is None:
+            with self._gates_lock:
+                gate = self.gates.setdefault(endpoint, ConcurrencyGate(
+                    limits['concurrency'], self.app.config['RATELIMIT_MAX_QUEUE'],
+                    self.app.config['RATELIMIT_LATENCY_BUDGET']))
+        return gate
+
+    def _consume(self, buckets):
+        try:
+            result = self.storage.consume(buckets)
+        except Exception:
+            # Fail open: a storage outage must not take the site down with it.
+            # Log the first failure only, not one traceback per request.
+            with self._storage_lock:
+                first, self._storage_down = not self._storage_down, True
+            if first:
+                self.app.logger.exception('Rate limit storage unavailable, not limiting requests')
+            return True, 0
+        if self._storage_down:
+            with self._storage_lock:
+                recovered, self._storage_down = self._storage_down, False
+            if recovered:
+                self.app.logger.warning('Rate limit storage is available again')
+        return result
+
+    def _rejected(self, status, retry_after, message, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+        resp = Response(message, status, mimetype='text/plain')
+        resp.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return resp
+
+    def _record(self, started, waited=0):
+        elapsed = monotonic() - started - waited
+        g.limiter_overhead = elapsed
+        with self._stats_lock:
+            self.stats['checks'] += 1
+            self.stats['overhead_total'] += elapsed
+            self.stats['overhead_max'] = max(self.stats['overhead_max'], elapsed)
+
+    def _before_request(self):
+        """Admit the request through its endpoint's gate, then charge its buckets.
+
+        The gate comes first so a request shed with 503 has not used up any
+        tokens; a request the buckets then reject gives its slot straight back.
+        """
+        endpoint = request.endpoint
+        if not self.app.config['RATELIMIT_ENABLED'] or endpoint in (None, 'static'):
+            return None
+        started = monotonic()
+        limits = getattr(self.app.view_functions[endpoint], '_rate_limits', None)
+        gate = self._gate(endpoint, limits)
+        waited = 0
+        if gate is not None:
+            queued = monotonic()
+            acquired = gate.acquire()
+            admitted = monotonic()
+            waited = admitted - queued
+            with self._stats_lock:
+                self.stats['queue_wait_total'] += waited
+            if not acquired:
+                self._record(started, waited)
+                return self._rejected(503, gate.budget, 'Server is busy. Please try again shortly.', 'shed')
+
+        allowed, retry_after = self._consume(list(self._buckets(endpoint, limits)))
+        self._record(started, waited)
+        if not allowed:
+            if gate is not None:
+                gate.release()
+            return self._rejected(429, retry_after, 'Too many requests. Please slow down.', 'limited')
+        if gate is not None:
+            g.limiter_gate = gate
+            g.limiter_admitted = admitted
+        return None
+
+    def _after_request(self, response):
+        overhead = g.get('limiter_overhead')
+        if overhead is not None:
+            response.headers.add('Server-Timing', f'limiter;dur={overhead * 1000:.3f}')
+        return response
+
+    def _teardown_request(self, exc):
+        # Runs once a streamed body has finished, so the slot covers rendering too
+        gate = g.pop('limiter_gate', None)
+        if gate is not None:
+            gate.release(monotonic() - g.pop('limiter_admitted'))
+
+    def metrics(self):
+        if (not self.app.config['RATELIMIT_METRICS_ENABLED']
+                or request.remote_addr not in self.app.config['RATELIMIT_METRICS_ALLOW']):
+            abort(404)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        with self._gates_lock:
+            gates = dict(self.gates)
+        checks = stats['checks'] or 1
+        return jsonify({
+            'checks': stats['checks'],
+            'overhead_avg_us': round(stats['overhead_total'] / checks * 1e6, 2),
+            'overhead_max_us': round(stats['overhead_max'] * 1e6, 2),
+            'queue_wait_total_s': round(stats['queue_wait_total'], 3),
+            'limited_429': stats['limited'],
+            'shed_503': stats['shed'],
+            'gates': {name: {'active': gate.active, 'waiting': gate.waiting,
+                             'avg_latency_ms': round(gate.avg_latency * 1000, 2)}
+                      for name, gate in gates.items()},
+        })
+
+
+limiter = RateLimiter()
@@ -0,0 +1,246 @@
+# backend/test_ratelimit.py
+import logging
+import threading
+
+import pytest
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import ratelimit
+from conftest import login
+from ratelimit import ConcurrencyGate, MemoryStorage, RateLimiter, limiter, parse_rate
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, 'monotonic', fake)
+    return fake
+
+
+def test_parse_rate():
+    assert parse_rate('10/minute') == (10 / 60, 10)
+    assert parse_rate('5/second') == (5, 5)
+
+
+def test_bucket_refill_and_retry_after(clock):
+    storage = MemoryStorage()
+    bucket = [('k', 1.0, 2)]  # 1 token/s, burst of 2
+    assert storage.consume(bucket) == (True, 0)
+    assert storage.consume(bucket) == (True, 0)
+    assert storage.consume(bucket) == (False, pytest.approx(1.0))
+    clock.now += 0.5
+    assert storage.consume(bucket) == (False, pytest.approx(0.5))
+    clock.now += 0.5
+    assert storage.consume(bucket) == (True, 0)
+    # Refill never goes past the burst size
+    clock.now += 100
+    assert [storage.consume(bucket)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_rejected_request_charges_no_bucket(clock):
+    storage = MemoryStorage()
+    assert storage.consume([('route', 1.0, 1)])[0]
+    assert storage.consume([('ip', 1.0, 1), ('route', 1.0, 1)]) == (False, pytest.approx(1.0))
+    # The ip bucket still has its token
+    assert storage.consume([('ip', 1.0, 1)]) == (True, 0)
+
+
+def test_gate_sheds_when_queue_full():
+    gate = ConcurrencyGate(limit=1, max_queue=0, budget=5)
+    assert gate.acquire()
+    assert not gate.acquire()
+    assert gate.waiting == 0
+
+
+def test_gate_sheds_when_expected_wait_over_budget():
+    gate = ConcurrencyGate(limit=1, max_queue=10, budget=1)
+    gate.avg_latency = 2.0
+    assert gate.acquire()
+    assert not gate.acquire()
+
+
+def test_gate_queues_until_release():
+    gate = ConcurrencyGate(limit=1, max_queue=1, budget=5)
+    assert gate.acquire()
+    threading.Timer(0.05, gate.release, args=(0.05,)).start()
+    assert gate.acquire()
+    assert gate.active == 1
+    assert gate.avg_latency == pytest.approx(0.05)
+
+
+def test_gate_times_out_after_budget():
+    gate = ConcurrencyGate(limit=1, max_queue=1, budget=0.05)
+    assert gate.acquire()
+    assert not gate.acquire()
+    assert gate.waiting == 0
+
+
+def test_login_limited_with_retry_after(app, client):
+    codes = [client.post('/login', data={'email': 'a@b.c', 'password': 'x'}).status_code for _ in range(11)]
+    assert codes == [302] * 10 + [429]
+    resp = client.post('/login', data={'email': 'a@b.c', 'password': 'x'})
+    assert 1 <= int(resp.headers['Retry-After']) <= 6
+    # Only POSTs are limited
+    assert client.get('/login').status_code == 200
+
+
+def test_per_user_limit(app, client):
+    login(client, 1)
+    codes = [client.post('/cart/add/1').status_code for _ in range(31)]
+    assert codes[-1] == 429 and 429 not in codes[:-1]
+    login(client, 2)
+    assert client.post('/cart/add/1').status_code == 302
+
+
+def test_gate_slot_held_until_streamed_body_finishes(app, client):
+    resp = client.get('/', buffered=False)
+    assert resp.is_streamed
+    assert limiter.gates['feed'].active == 1
+    resp.get_data()
+    resp.close()
+    assert limiter.gates['feed'].active == 0
+
+
+def _gated_app(rate):
+    app = Flask(__name__)
+    app.config.update(RATELIMIT_DEFAULT='100/minute', RATELIMIT_MAX_QUEUE=0)
+    fake = RateLimiter()
+    fake.init_app(app)
+    app.add_url_rule('/', 'index', fake.limit(per_ip=rate, concurrency=1)(lambda: 'ok'))
+    return app, fake
+
+
+def test_shed_request_charges_no_bucket():
+    app, fake = _gated_app('1/minute')
+    gate = fake._gate('index', app.view_functions['index']._rate_limits)
+    assert gate.acquire()
+    assert app.test_client().get('/').status_code == 503
+    gate.release()
+    assert app.test_client().get('/').status_code == 200
+
+
+def test_limited_request_frees_gate_slot():
+    app, fake = _gated_app('1/minute')
+    client = app.test_client()
+    assert client.get('/').status_code == 200
+    gate = fake.gates['index']
+    latency = gate.avg_latency
+    assert client.get('/').status_code == 429
+    assert gate.active == 0
+    # A rejected request did no work, so it leaves the latency average alone
+    assert gate.avg_latency == latency
+
+
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+def test_gate_slot_freed_when_streamed_body_closed_early(app, client, encoding):
+    resp = client.get('/', headers={'Accept-Encoding': encoding}, buffered=False)
+    assert next(iter(resp.response))
+    assert limiter.gates['feed'].active == 1
+    # A client disconnect: the server closes the body without reading the rest
+    resp.close()
+    assert limiter.gates['feed'].active == 0
+
+
+def test_server_timing_header(app, client):
+    assert client.get('/login').headers['Server-Timing'].startswith('limiter;dur=')
+
+
+def test_metrics_loopback_only_and_rate_limited(app, client, monkeypatch):
+    assert client.get('/metrics/limiter').get_json()['checks'] >= 1
+    assert client.get('/metrics/limiter', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 404
+    monkeypatch.setattr(limiter, 'default', parse_rate('2/minute'))
+    codes = [client.get('/metrics/limiter').status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+
+
+def test_metrics_while_gates_are_created(app):
+    # metrics() must snapshot the gates, not iterate the live dict
+    fake = RateLimiter()
+    fake.app = app
+    started = threading.Event()
+    stop = threading.Event()
+
+    def add_gates():
+        for i in range(500):
+            if stop.is_set():
+                break
+            fake._gate(f'endpoint-{i}', {'concurrency': 1})
+            started.set()
+
+    worker = threading.Thread(target=add_gates)
+    worker.start()
+    try:
+        assert started.wait(1)
+        with app.test_request_context('/metrics/limiter', environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            for _ in range(20):
+                fake.metrics()
+    finally:
+        stop.set()
+        worker.join()
+
+
+def test_metrics_can_be_disabled(app, client):
+    app.config['RATELIMIT_METRICS_ENABLED'] = False
+    try:
+        assert client.get('/metrics/limiter').status_code == 404
+    finally:
+        app.config['RATELIMIT_METRICS_ENABLED'] = True
+
+
+def test_storage_outage_fails_open_and_logs_once(app, client, monkeypatch, caplog):
+    class BrokenStorage:
+        def consume(self, buckets):
+            raise ConnectionError('down')
+
+    monkeypatch.setattr(limiter, 'storage', BrokenStorage())
+    with caplog.at_level(logging.ERROR):
+        assert client.get('/login').status_code == 200
+        assert client.get('/login').status_code == 200
+    assert len([r for r in caplog.records if 'unavailable' in r.getMessage()]) == 1
+    monkeypatch.setattr(limiter, 'storage', MemoryStorage())
+    assert client.get('/login').status_code == 200
+    monkeypatch.setattr(limiter, 'storage', BrokenStorage())
+    with caplog.at_level(logging.ERROR):
+        client.get('/login')
+    assert len([r for r in caplog.records if 'unavailable' in r.getMessage()]) == 2
+
+
+def test_storage_outage_logged_once_across_threads(app, monkeypatch, caplog):
+    barrier = threading.Barrier(8)
+
+    class BrokenStorage:
+        def consume(self, buckets):
+            barrier.wait()
+            raise ConnectionError('down')
+
+    monkeypatch.setattr(limiter, 'storage', BrokenStorage())
+    with caplog.at_level(logging.ERROR):
+        threads = [threading.Thread(target=limiter._consume, args=([],)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert len([r for r in caplog.records if 'unavailable' in r.getMessage()]) == 1
+
+
+def test_limits_per_client_behind_proxy_fix():
+    app = Flask(__name__)
+    app.config['RATELIMIT_DEFAULT'] = '1/minute'
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    RateLimiter().init_app(app)
+    app.add_url_rule('/', 'index', lambda: 'ok')
+    client = app.test_client()
+
+    def get(ip):
+        return client.get('/', headers={'X-Forwarded-For': ip}).status_code
+
+    assert [get('1.1.1.1'), get('2.2.2.2'), get('1.1.1.1')] == [200, 200, 429]
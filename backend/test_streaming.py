@@ -0,0 +1,205 @@
+# backend/test_streaming.py
+import gzip
+from datetime import datetime, timedelta
+
+import pytest
+from flask import has_request_context, template_rendered
+from sqlalchemy import event
+
+import app as app_module
+from conftest import login
+from models import db, User, Product, Purchase
+
+
+def add_user(name):
+    user = User(username=name, email=f'{name}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_products(user, count):
+    start = datetime(2025, 1, 1)
+    products = [Product(user_id=user.id, title=f'item-{i}', category='Books', price=1,
+                        created_at=start + timedelta(minutes=i)) for i in range(count)]
+    db.session.add_all(products)
+    db.session.commit()
+    return products
+
+
+def test_feed_is_streamed_and_gzipped(app, client):
+    with app.app_context():
+        add_products(add_user('seller'), 30)
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    html = gzip.decompress(resp.get_data()).decode()
+    assert html.count('card-title') == 30
+    assert html.rstrip().endswith('</html>')
+
+
+def test_feed_brotli_preferred_when_accepted(app, client):
+    brotli = pytest.importorskip('brotli')
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip, br'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert b'No products found.' in brotli.decompress(resp.get_data())
+
+
+def test_uncompressed_without_accept_encoding(app, client):
+    resp = client.get('/')
+    assert 'Content-Encoding' not in resp.headers
+    assert b'Product Feed' in resp.get_data()
+
+
+def test_min_size_cutoff(app, client):
+    page = client.get('/login').get_data()
+    app.config['COMPRESS_MIN_SIZE'] = len(page) + 1
+    try:
+        resp = client.get('/login', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.get_data() == page
+        app.config['COMPRESS_MIN_SIZE'] = len(page)
+        resp = client.get('/login', headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert int(resp.headers['Content-Length']) == len(resp.get_data())
+        assert gzip.decompress(resp.get_data()) == page
+    finally:
+        app.config['COMPRESS_MIN_SIZE'] = 500
+
+
+def test_flashes_popped_before_streaming(app, client):
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('info', 'hello there')]
+    assert 'hello there' in client.get('/').get_data(as_text=True)
+    with client.session_transaction() as sess:
+        assert '_flashes' not in sess
+    assert 'hello there' not in client.get('/').get_data(as_text=True)
+
+
+def test_streamed_page_sends_template_signals(app, client):
+    pytest.importorskip('blinker')
+    rendered = []
+
+    def record(sender, template, context):
+        rendered.append(template.name)
+
+    with template_rendered.connected_to(record, app):
+        resp = client.get('/')
+        assert rendered == []
+        resp.get_data()
+    assert rendered == ['feed.html']
+
+
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+def test_closing_stream_early_ends_request(app, client, encoding):
+    with app.app_context():
+        add_products(add_user('seller'), 30)
+    resp = client.get('/', headers={'Accept-Encoding': encoding}, buffered=False)
+    assert next(iter(resp.response))
+    assert has_request_context()
+    # What a WSGI server does when the client goes away mid-page
+    resp.close()
+    assert not has_request_context()
+
+
+def test_my_listings_groups_orders_per_product(app, client):
+    with app.app_context():
+        seller, buyer = add_user('seller'), add_user('buyer')
+        unsold, sold_once, sold_twice = add_products(seller, 3)
+        add_products(buyer, 1)
+        db.session.add_all([
+            Purchase(user_id=buyer.id, product_id=sold_once.id, address='addr-a',
+                     purchased_at=datetime(2025, 2, 1)),
+            Purchase(user_id=buyer.id, product_id=sold_twice.id, address='addr-old',
+                     purchased_at=datetime(2025, 2, 1)),
+            Purchase(user_id=buyer.id, product_id=sold_twice.id, address='addr-new',
+                     purchased_at=datetime(2025, 3, 1)),
+        ])
+        db.session.commit()
+        seller_id = seller.id
+    login(client, seller_id)
+    html = client.get('/my-listings').get_data(as_text=True)
+    assert html.rstrip().endswith('</html>')
+    rows = html.split('<tbody>')[1].split('</tbody>')[0].split('<tr>')[1:]
+    assert len(rows) == 3
+    # Newest listing first, each with only its own orders, newest order first
+    assert 'item-2' in rows[0] and rows[0].index('addr-new') < rows[0].index('addr-old')
+    assert 'item-1' in rows[1] and 'addr-a' in rows[1] and 'addr-new' not in rows[1]
+    assert 'item-0' in rows[2] and 'No orders yet' in rows[2]
+    assert 'item-3' not in html
+
+
+def test_my_listings_runs_one_statement_while_streaming(app, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_YIELD_PER', 3)
+    with app.app_context():
+        seller = add_user('seller')
+        buyers = [add_user(f'buyer{i}') for i in range(5)]
+        products = add_products(seller, 10)
+        db.session.add_all([Purchase(user_id=buyers[i % 5].id, product_id=p.id, address=f'addr-{i}')
+                            for i, p in enumerate(products)])
+        db.session.commit()
+        seller_id = seller.id
+        engine = db.engine
+    login(client, seller_id)
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        html = client.get('/my-listings').get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 1
+    assert html.count('addr-') == 10
+    assert all(f'buyer{i}' in html for i in range(5))
+
+
+def test_my_listings_empty(app, client):
+    with app.app_context():
+        user_id = add_user('seller').id
+    login(client, user_id)
+    assert "You haven't listed any products yet." in client.get('/my-listings').get_data(as_text=True)
+
+
+def seed_order(app):
+    with app.app_context():
+        seller, buyer = add_user('seller'), add_user('buyer')
+        product = add_products(seller, 1)[0]
+        order = Purchase(user_id=buyer.id, product_id=product.id, address='addr')
+        db.session.add(order)
+        db.session.commit()
+        return seller.id, buyer.id, order.id
+
+
+def order_status(app, order_id):
+    with app.app_context():
+        return db.session.get(Purchase, order_id).status
+
+
+def test_update_order_status_requires_seller(app, client):
+    _, buyer_id, order_id = seed_order(app)
+    login(client, buyer_id)
+    resp = client.post(f'/order/{order_id}/status', data={'status': 'Shipped'}, follow_redirects=True)
+    assert 'Not allowed.' in resp.get_data(as_text=True)
+    assert order_status(app, order_id) == 'Pending'
+
+
+def test_update_order_status_rejects_invalid_status(app, client):
+    seller_id, _, order_id = seed_order(app)
+    login(client, seller_id)
+    resp = client.post(f'/order/{order_id}/status', data={'status': 'Lost'}, follow_redirects=True)
+    assert 'Invalid order status.' in resp.get_data(as_text=True)
+    assert order_status(app, order_id) == 'Pending'
+
+
+def test_update_order_status_saves_change(app, client):
+    seller_id, _, order_id = seed_order(app)
+    login(client, seller_id)
+    resp = client.post(f'/order/{order_id}/status', data={'status': 'Shipped'}, follow_redirects=True)
+    assert 'Order status updated.' in resp.get_data(as_text=True)
+    assert order_status(app, order_id) == 'Shipped'